@@ -2,18 +2,20 @@
 
 """Analyze pycldf word list using lingpy"""
 
+import sys
 import json
+import operator
+from pathlib import Path
 
 import argparse
 
-import pycldf
-from pycldf.util import Path
-from pycldf.dataset import Dataset
-from pycldf.cli import _get_dataset
+# pycldf and lingpy are slow to import, so they are only imported where they
+# are needed, to keep `--help` and argument errors fast.
 
-import lingpy
-from lingpy.align.sca import Alignments
-from lingpy.compare.lexstat import LexStat
+# Segmentation and boundary markers. Tokens consisting only of these, alone or
+# combined (such as "_."), are dropped from LingPy's TOKENS, and so are the
+# empty tokens produced by doubled separators.
+MARKERS = "(,_.-;)"
 
 
 def get_dataset(fname):
@@ -36,6 +38,8 @@ def get_dataset(fname):
     -------
     Dataset
     """
+    from pycldf.dataset import Dataset
+
     fname = Path(fname)
     if not fname.exists():
         raise FileNotFoundError(
@@ -45,18 +49,85 @@ def get_dataset(fname):
     return Dataset.from_data(fname)
 
 
+def iter_forms(wordlist, *properties):
+    """Iterate over selected columns of the FormTable of a CLDF wordlist.
+
+    Read the FormTable as delimited text instead of going through csvw's
+    `iterdicts()`, which builds a fully typed dict of all columns for every
+    row, and pick only the requested columns by position. The file is still
+    located and read the way csvw does it (zipped data files, the table's
+    CSVW dialect, header cells matched by column name or title), and cells
+    matching a column's `null` values are yielded as empty strings.
+
+    Parameters
+    ----------
+    wordlist : Wordlist
+        The CLDF wordlist to read from
+    properties : str
+        CLDF properties of the FormTable, such as "id" or "soundSequence"
+
+    Yields
+    ------
+    tuple of str
+        The raw cell values of the requested columns, in the order of
+        `properties`. If only one property is requested, the bare value is
+        yielded instead, as with `operator.itemgetter`.
+    """
+    import contextlib
+
+    columns = [wordlist[("FormTable", p)] for p in properties]
+    table = wordlist[wordlist.primary_table]
+    dialect = table._get_dialect()
+    with contextlib.ExitStack() as stack:
+        reader = table._get_csv_reader(
+            table.url.resolve(table.base), dialect, stack)
+        rows = (row for lineno, row in reader)
+        if dialect.header:
+            try:
+                header = [table.tableSchema.get_column(h) for h in next(rows)]
+            except StopIteration:
+                return
+        else:
+            header = table.tableSchema.columns
+        col_idx = {column.name: i
+                   for i, column in enumerate(header) if column is not None}
+        indices = [col_idx[column.name] for column in columns]
+        # Only the default null value, the empty cell, can be passed through
+        # unchanged; other null values are blanked before picking columns.
+        nulls = [(i, frozenset(column.inherit_null()))
+                 for i, column in zip(indices, columns)
+                 if set(column.inherit_null()) - {""}]
+        if nulls:
+            rows = _blank_nulls(rows, nulls)
+        yield from map(operator.itemgetter(*indices), rows)
+
+
+def _blank_nulls(rows, nulls):
+    """Replace cells matching their column's null values by empty strings."""
+    for row in rows:
+        for i, null in nulls:
+            if row[i] in null:
+                row[i] = ""
+        yield row
+
+
 def to_lingpy(wordlist, replace_tab=" ", replace_newline=" "):
-    """Write a CLDF wordlist in LingPy format.
+    """Convert a CLDF wordlist to LingPy format.
 
-    Write all rows from a CLDF wordlist to a LingPy-readable file. The LingPy
-    file parser is extremely naïve and cannot understand quoted cells, so every
-    "\\t" (field separator) and "\\n" (row separator) inside the wordlist cells
-    will be replaced by `replace_tab` and `replace_newline` respectively.
+    Convert all rows from a CLDF wordlist to a LingPy-readable dict, which can
+    be passed to LingPy's wordlist classes directly without a round-trip
+    through a file. LingPy's output writers are extremely naïve and cannot
+    quote cells, so every "\\t" (field separator) and "\\n" (row separator)
+    inside the wordlist cells will be replaced by `replace_tab` and
+    `replace_newline` respectively.
 
     NOTE: Currently, this function can only convert the following properties,
     naming the columns as follows: id→REFERENCE, languageReference→DOCULECT,
     parameterReference→CONCEPT, soundSequence→TOKENS.
 
+    TOKENS leaves out segments made up only of the segmentation and boundary
+    markers in `MARKERS`, such as "_", "." or "_.", which IPA keeps.
+
     The ID values of the original wordlist will be stored in a REFERENCE column
     for LingPy, because LingPy expects its IDs to be subsequent integers.
 
@@ -71,33 +142,37 @@ def to_lingpy(wordlist, replace_tab=" ", replace_newline=" "):
 
     Returns
     -------
-    tempfile.NamedTemporaryFile
-        A named temporary file containing the LingPy-formatted wordlist
+    dict
+        The LingPy-formatted wordlist: the header at key 0 and one row per
+        form at the subsequent integer keys
     """
-    lpwl = {}
-
-    def lingpy_write(entries):
-        lpwl[len(lpwl)] = [
-            entry.replace("\t", replace_tab
-            ).replace("\n", replace_newline)
-            if type(entry) == str
-            else entry
-            for entry in entries]
-
-    lingpy_write(["ID", "REFERENCE", "DOCULECT", "CONCEPT", "IPA", "TOKENS"])
-    reference = wordlist[("FormTable", "id")].name
-    doculect = wordlist[("FormTable", "languageReference")].name
-    concept = wordlist[("FormTable", "parameterReference")].name
-    tokens = wordlist[("FormTable", "soundSequence")].name
-    for r, row in enumerate(
-            wordlist[wordlist.primary_table].iterdicts()):
-        if not row[tokens]:
+    replacements = str.maketrans({"\t": replace_tab, "\n": replace_newline})
+
+    def clean(cell):
+        # Tabs and newlines are rare in lexical data, so only build a new
+        # string for the cells that actually contain one.
+        if "\t" in cell or "\n" in cell:
+            return cell.translate(replacements)
+        return cell
+
+    rows = [["ID", "REFERENCE", "DOCULECT", "CONCEPT", "IPA", "TOKENS"]]
+    separator = wordlist[("FormTable", "soundSequence")].separator or " "
+    for r, (ref_v, doc_v, con_v, tok_v) in enumerate(iter_forms(
+            wordlist, "id", "languageReference", "parameterReference",
+            "soundSequence")):
+        if not tok_v:
             continue
-        lingpy_row = [
-            r+1, row[reference], row[doculect], row[concept], ''.join(row[tokens]), [x for x in row[tokens] if x not in "(,_.-;)"]
-        ]
-        lingpy_write(lingpy_row)
-    return lpwl
+        segments = tok_v.split(separator)
+        rows.append([
+            r+1,
+            clean(ref_v),
+            clean(doc_v),
+            clean(con_v),
+            clean(''.join(segments)),
+            [x for x in segments if x.strip(MARKERS)]])
+    # LingPy expects a dict with the header at key 0 and the rows at the
+    # subsequent integer keys.
+    return dict(enumerate(rows))
 
 
 def cognatetable_from_lingpy(lingpy, column="cogid"):
@@ -112,30 +187,48 @@ def cognatetable_from_lingpy(lingpy, column="cogid"):
         The name of the LingPy column containing the cognate classes (Default
         value = "cogid")
 
-    Returns
-    -------
-    cognates : [{`column`: `value`}]
-        A list of rows, which can be written to a standard CLDF CognateTable
+    Yields
+    ------
+    cognate : {`column`: `value`}
+        One row at a time, to be written to a standard CLDF CognateTable
+        without holding the whole table in memory
 
     """
-    cognates = []
-    for r, row in enumerate(lexstat._data.values()):
-        row = {k: row[v] for k, v in lexstat.header.items()}
-        cognates.append({
+    columns = operator.itemgetter(
+        lingpy.header["reference"],
+        lingpy.header[column],
+        lingpy.header["alignment"])
+    for r, (reference, cognateset, alignment) in enumerate(
+            map(columns, lingpy._data.values())):
+        yield {
             "ID": r,
-            "Form_ID": row["reference"],
-            "Cognateset_ID": row[column],
-            "Alignment": row["alignment"],
-            "Source": ["LexStat"]})
-    return cognates
+            "Form_ID": reference,
+            "Cognateset_ID": cognateset,
+            "Alignment": alignment,
+            "Source": ["LexStat"]}
 
 def find_bad_tokens(wordlist):
     """Collect which bad symbols appear in which forms."""
+    from lingpy.sequence.sound_classes import token2class
+
+    # The segment inventory is tiny compared to the number of forms, so
+    # classify every distinct segment once instead of every row separately.
+    # token2class is used instead of tokens2class, which refuses sequences
+    # made up entirely of unknown segments; like tokens2class, it reads
+    # CLDF "source/target" segments by their target.
+    inventory = {token
+                 for k, segments in wordlist.iter_rows('tokens')
+                 for token in segments}
+    bad = frozenset(
+        token for token in inventory
+        if token2class(token, 'dolgo', cldf=True) == "0")
     bad_tokens = {}
     for k, segments, form_id in wordlist.iter_rows('tokens', "reference"):
-        classes = lingpy.tokens2class(segments, 'dolgo')
-        for token, cls in zip(segments, classes):
-            if cls == "0":
+        # Most forms contain no bad segment at all; skip them in one C call.
+        if bad.isdisjoint(segments):
+            continue
+        for token in segments:
+            if token in bad:
                 bad_tokens.setdefault(token, []).append(form_id)
     return bad_tokens
 
@@ -157,6 +250,9 @@ if __name__ == '__main__':
     parser.add_argument(
         "--threshold", type=float, default=False,
         help="Use this threshold for the cluster algorithm")
+    parser.add_argument(
+        "--runs", type=int, default=10000,
+        help="The number of permutations used to estimate the LexStat scorer")
     parser.add_argument(
         "--overwrite", action="store_true", default=False,
         help="Overwrite an existing CognateTable if one exists.")
@@ -165,6 +261,9 @@ if __name__ == '__main__':
         help="File to write a list of bad tokens to")
     args = parser.parse_args()
 
+    from lingpy.align.sca import Alignments
+    from lingpy.compare.lexstat import LexStat
+
     # Load the word list into a LingPy compatible format
     if args.wordlist is None:
         try:
@@ -190,7 +289,7 @@ if __name__ == '__main__':
 
     # Prepare analysis
     if args.method != 'sca':
-        lexstat.get_scorer(preprocessing=False, runs=10000, ratio=(2,1), vscale=1.0)
+        lexstat.get_scorer(preprocessing=False, runs=args.runs, ratio=(2,1), vscale=1.0)
     lexstat.cluster(method=args.method, cluster_method=args.cluster_method, ref="cogid",
                     threshold=args.threshold)
     lexstat = Alignments(lexstat, segments="tokens")
@@ -0,0 +1,127 @@
+import json
+import zipfile
+
+import pytest
+import lingpy
+import pycldf
+
+from lingpycldf.lexstat import get_dataset, to_lingpy, find_bad_tokens
+
+TERMS = "http://cldf.clld.org/v1.0/terms.rdf#"
+
+FORMS = [
+    ["ID", "Language_ID", "Parameter_ID", "soundSequence"],
+    ["f1", "l1", "p1", "p a"],
+    ["f2", "l2", "p1", "b a _"],
+    ["f3", "l1", "p2", ""],
+]
+
+LINGPY_FORMS = {
+    0: ["ID", "REFERENCE", "DOCULECT", "CONCEPT", "IPA", "TOKENS"],
+    1: [1, "f1", "l1", "p1", "pa", ["p", "a"]],
+    2: [2, "f2", "l2", "p1", "ba_", ["b", "a"]],
+}
+
+
+def csv_data(rows, delimiter=","):
+    return "".join(delimiter.join(row) + "\n" for row in rows).encode("utf-8")
+
+
+def make_wordlist(directory, data, dialect=None, columns=None, zipped=False):
+    """Write a minimal CLDF Wordlist with the given FormTable data."""
+    metadata = {
+        "@context": "http://www.w3.org/ns/csvw",
+        "dc:conformsTo": TERMS + "Wordlist",
+        "tables": [{
+            "url": "forms.csv",
+            "dc:conformsTo": TERMS + "FormTable",
+            "dialect": dialect or {},
+            "tableSchema": {
+                "columns": [
+                    {"name": "ID", "propertyUrl": TERMS + "id"},
+                    {"name": "Language_ID",
+                     "propertyUrl": TERMS + "languageReference"},
+                    {"name": "Parameter_ID",
+                     "propertyUrl": TERMS + "parameterReference"},
+                    {"name": "soundSequence", "separator": " "}],
+                "primaryKey": ["ID"]}}]}
+    for column, properties in zip(
+            metadata["tables"][0]["tableSchema"]["columns"], columns or []):
+        column.update(properties)
+    metadata_path = directory / "Wordlist-metadata.json"
+    metadata_path.write_text(json.dumps(metadata), encoding="utf-8")
+    if zipped:
+        with zipfile.ZipFile(directory / "forms.csv.zip", "w") as archive:
+            archive.writestr("forms.csv", data)
+    else:
+        (directory / "forms.csv").write_bytes(data)
+    return pycldf.Dataset.from_metadata(metadata_path)
+
+
+def test_get_dataset(tmp_path):
+    make_wordlist(tmp_path, csv_data(FORMS))
+    wordlist = get_dataset(str(tmp_path / "Wordlist-metadata.json"))
+    assert wordlist.module == "Wordlist"
+    with pytest.raises(FileNotFoundError):
+        get_dataset(str(tmp_path / "missing-metadata.json"))
+
+
+@pytest.mark.parametrize("data,options,expected", [
+    pytest.param(
+        csv_data(FORMS, "\t"), {"dialect": {"delimiter": "\t"}},
+        LINGPY_FORMS, id="tab-delimited"),
+    pytest.param(
+        b"\xef\xbb\xbf" + csv_data(FORMS), {}, LINGPY_FORMS, id="bom"),
+    pytest.param(
+        b"Forms of a test wordlist\n# A comment\n" + csv_data(FORMS),
+        {"dialect": {"commentPrefix": "#", "skipRows": 1}},
+        LINGPY_FORMS, id="comments-and-skipped-rows"),
+    pytest.param(
+        csv_data(FORMS), {"zipped": True}, LINGPY_FORMS, id="zipped"),
+    pytest.param(
+        csv_data([["ID", "lang", "Parameter_ID", "soundSequence"]]
+                 + FORMS[1:]),
+        {"columns": [{}, {"titles": "lang"}]},
+        LINGPY_FORMS, id="header-titles"),
+    pytest.param(
+        csv_data(FORMS[:3] + [["f3", "l1", "p2", "?"]]),
+        {"columns": [{}, {}, {}, {"null": ["?"]}]},
+        LINGPY_FORMS, id="custom-null"),
+    pytest.param(
+        b"", {}, {0: LINGPY_FORMS[0]}, id="empty-file"),
+])
+def test_to_lingpy_dialect(tmp_path, data, options, expected):
+    wordlist = make_wordlist(tmp_path, data, **options)
+    assert len(list(wordlist["FormTable"].iterdicts())) == len(
+        [row for row in data.splitlines() if row.startswith(b"f")])
+    assert to_lingpy(wordlist) == expected
+
+
+def test_to_lingpy_markers(tmp_path):
+    wordlist = make_wordlist(tmp_path, csv_data(
+        FORMS[:1] + [["f1", "l1", "p1", "p a _. t ._ a  -"]]))
+    assert to_lingpy(wordlist)[1] == [
+        1, "f1", "l1", "p1", "pa_.t._a-", ["p", "a", "t", "a"]]
+
+
+def test_find_bad_tokens():
+    header = ["doculect", "concept", "tokens", "reference"]
+    wordlist = lingpy.Wordlist({
+        0: header,
+        1: ["l1", "c1", ["p", "a", "@"], "f1"],
+        2: ["l2", "c1", ["b", "a"], "f2"]})
+    assert find_bad_tokens(wordlist) == {"@": ["f1"]}
+    # A form made up of nothing but unknown segments must not trip up
+    # LingPy's sound class conversion.
+    wordlist = lingpy.Wordlist({
+        0: header,
+        1: ["l1", "c1", ["§", "%"], "f1"],
+        2: ["l2", "c1", ["§"], "f2"]})
+    assert find_bad_tokens(wordlist) == {"§": ["f1", "f2"], "%": ["f1"]}
+    # Segments in CLDF "source/target" notation are classified by their
+    # target, as lingpy.tokens2class does.
+    wordlist = lingpy.Wordlist({
+        0: header,
+        1: ["l1", "c1", ["§/t", "a", "*/p"], "f1"],
+        2: ["l2", "c1", ["t/", "a"], "f2"]})
+    assert find_bad_tokens(wordlist) == {"t/": ["f2"]}